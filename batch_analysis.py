@@ -0,0 +1,221 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from financial_analysis import PairTradingFinancialAnalysis
+from price_matrix import PriceMatrix, AnalysisScratch
+from risk_metrics import METRIC_NAMES, risk_metrics
+
+# Columns written to the spill file for every signal segment, in file order.
+# Times are stored as row positions into the shared date index.
+SPILL_COLUMNS = (
+    ("result_id", np.int64),
+    ("signal", np.int8),
+    ("row_start", np.int32),
+    ("row_end", np.int32),
+    ("stock1_start_price", np.float64),
+    ("stock1_final_price", np.float64),
+    ("stock2_start_price", np.float64),
+    ("stock2_final_price", np.float64),
+    ("margin", np.float64), # Margin after the trade, NaN for neutral segments
+)
+
+PARAMETER_NAMES = ("window", "zscore_threshold", "neutral_threshold",
+                   "margin_init", "margin_ratio")
+
+# Build every combination of the given parameter values as a list of dicts
+def parameter_grid(window=(10,), zscore_threshold=(2,), neutral_threshold=(1,),
+                   margin_init=(10000,), margin_ratio=(0.25,)):
+    return [
+        dict(zip(PARAMETER_NAMES, values))
+        for values in itertools.product(window, zscore_threshold, neutral_threshold,
+                                        margin_init, margin_ratio)
+    ]
+
+
+class SegmentSpillWriter:
+    # Append-only columnar spill file for signal segments and margin paths.
+    # Segments are buffered and written in batches of at most `batch_rows`
+    # rows; each batch is one np.save array per column in SPILL_COLUMNS order.
+    # `path` may also be an open binary file object, which is left open.
+    # result_id restarts at 0 on every run, so an existing non-empty file is
+    # refused unless append=True is passed explicitly (e.g. when resuming).
+    def __init__(self, path, batch_rows=65536, append=False):
+        self.path = path
+        self.batch_rows = batch_rows
+        self._owns_file = isinstance(path, (str, os.PathLike))
+        if self._owns_file:
+            if not append and os.path.exists(path) and os.path.getsize(path) > 0:
+                raise FileExistsError(
+                    f"Spill file {path} is not empty; pass append=True to add to it"
+                )
+            self.file = open(path, "ab")
+        else:
+            self.file = path
+        self.rows_written = 0
+        self._chunks = []
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Queue the segments of one finished analysis
+    def append(self, result_id, analysis):
+        summary = analysis.df_signal_summary
+        n_rows = len(analysis.dates)
+        starts = analysis.segment_starts
+
+        signal = summary["signal"].to_numpy()
+        margin = np.full(len(summary), np.nan)
+        margin[np.isin(signal, (1, -1))] = analysis.df_margin["margin"].to_numpy()
+
+        self._chunks.append((
+            np.full(len(summary), result_id),
+            signal,
+            starts,
+            np.append(starts[1:], n_rows - 1),
+            summary["stock1_start_price"].to_numpy(),
+            summary["stock1_final_price"].to_numpy(),
+            summary["stock2_start_price"].to_numpy(),
+            summary["stock2_final_price"].to_numpy(),
+            margin,
+        ))
+        self._buffered += len(summary)
+        if self._buffered >= self.batch_rows:
+            self._write(full_batches_only=True)
+
+    # Write every buffered segment, the last batch possibly short
+    def flush(self):
+        self._write(full_batches_only=False)
+
+    # Write buffered segments in slices of batch_rows; with full_batches_only
+    # a trailing partial batch stays buffered
+    def _write(self, full_batches_only):
+        if not self._chunks:
+            return
+        columns = [
+            np.concatenate([chunk[i] for chunk in self._chunks]).astype(dtype)
+            for i, (_, dtype) in enumerate(SPILL_COLUMNS)
+        ]
+        total = len(columns[0])
+        written = 0
+        while total - written >= self.batch_rows or (not full_batches_only and written < total):
+            stop = min(written + self.batch_rows, total)
+            for column in columns:
+                np.save(self.file, column[written:stop], allow_pickle=False)
+            written = stop
+        self.file.flush()
+
+        self._chunks = [tuple(column[written:] for column in columns)] if written < total else []
+        self._buffered = total - written
+        self.rows_written += written
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        if self._owns_file:
+            self.file.close()
+
+
+# Read a spill file back one batch at a time as DataFrames.
+# Pass the shared date index to turn row positions into time_start / time_end.
+def read_spill(path, dates=None):
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        while file.tell() < size:
+            batch = pd.DataFrame({
+                name: np.load(file, allow_pickle=False) for name, _ in SPILL_COLUMNS
+            })
+            if dates is not None:
+                batch["time_start"] = dates[batch["row_start"].to_numpy()]
+                batch["time_end"] = dates[batch["row_end"].to_numpy()]
+            yield batch
+
+
+# Number every pair x parameter set combination: result_id runs over the
+# parameter sets fastest, so a result_id maps back to one pair and one set
+def combination(pairs, param_sets, result_id):
+    pair_index, param_index = divmod(result_id, len(param_sets))
+    return tuple(pairs[pair_index]), param_sets[param_index]
+
+
+# Run the combinations with result_id in [start, stop) and yield compact
+# per-pair results as they finish. Only summary metrics are kept in memory;
+# when a spill writer is given, signal segments and margin paths are streamed
+# to disk instead. pair_lags maps a pair to its lead-lag (default 0).
+# By default each result, with its risk metrics, is yielded as soon as its
+# analysis finishes. metrics_block > 1 opts in to computing the metrics for
+# that many pairs in one vectorized pass, holding results back until the
+# block is full (their segments may already be in the spill file).
+def iter_combination_results(prices, pairs, param_sets, start, stop,
+                             spill=None, scratch=None, pair_lags=None,
+                             metrics_block=1):
+    if not isinstance(prices, PriceMatrix):
+        prices = PriceMatrix.from_frame(prices)
+    if scratch is None:
+        scratch = AnalysisScratch(len(prices))
+
+    equity = np.empty((len(prices), metrics_block))
+    in_market = np.empty((len(prices), metrics_block), dtype=bool)
+    pending = [] # (result, traded_notional, total_commission, margin_init)
+
+    for result_id in range(start, stop):
+        pair, params = combination(pairs, param_sets, result_id)
+        lag = pair_lags.get(pair, 0) if pair_lags else 0
+        analysis = PairTradingFinancialAnalysis(
+            pair, prices, scratch=scratch, verbose=False, lag=lag, **params
+        )
+        analysis.compute_zscore()
+        analysis.generate_signals()
+        analysis.summarize_signals()
+        analysis.calculate_margin()
+        analysis.compute_equity_curve()
+
+        if spill is not None:
+            spill.append(result_id, analysis)
+
+        equity[:, len(pending)] = analysis.equity
+        in_market[:, len(pending)] = analysis.in_market
+        pending.append(({
+            "result_id": result_id,
+            "pair": pair,
+            **params,
+            "lag": lag,
+            "final_margin": analysis.margin,
+            "total_pnl": analysis.margin - analysis.margin_init,
+            "n_segments": len(analysis.df_signal_summary),
+            "n_trades": len(analysis.df_margin),
+        }, analysis.traded_notional, analysis.total_commission, analysis.margin_init))
+
+        if len(pending) == metrics_block or result_id == stop - 1:
+            yield from _with_metrics(pending, equity, in_market)
+            pending = []
+
+
+# Attach block risk metrics to the pending results, in order
+def _with_metrics(pending, equity, in_market):
+    k = len(pending)
+    results, traded_notional, commission, margin_init = zip(*pending)
+    metrics = risk_metrics(equity[:, :k], in_market[:, :k], traded_notional,
+                           commission, margin_init)
+    for i, result in enumerate(results):
+        for name in METRIC_NAMES:
+            result[name] = float(metrics[name][i])
+        yield result
+
+
+# Run every pair x parameter set combination (see iter_combination_results)
+def iter_analysis_results(prices, pairs, param_sets, spill=None, scratch=None,
+                          pair_lags=None, metrics_block=1):
+    pairs = list(pairs)
+    param_sets = list(param_sets)
+    return iter_combination_results(
+        prices, pairs, param_sets, 0, len(pairs) * len(param_sets),
+        spill=spill, scratch=scratch, pair_lags=pair_lags, metrics_block=metrics_block
+    )
@@ -6,6 +6,9 @@ from io import StringIO
 import logging
 import numpy as np
 
+from lead_lag import lead_lag_correlation
+from price_matrix import PriceMatrix
+
 # Configures logging to write error messages to a file
 logging.basicConfig(filename='failed_downloads.log', level=logging.ERROR)
 
@@ -24,7 +27,9 @@ class SP500Data:
         self.sp500 = None # DataFrame containing S&P500 data
         self.sp500_list = None # List of ticker symbols
         self.data_1d = None # DataFrame of daily closing prices
+        self.price_matrix = None # PriceMatrix view of data_1d for batch analysis
         self.high_corr_pairs = None # List of tuples of highly correlated stock pairs
+        self.pair_lags = {} # (stock1, stock2) -> lead-lag in days, empty for same-day pairs
 
         self.start_time = None
         self.end_time = None
@@ -60,6 +65,10 @@ class SP500Data:
                 interval='1d', auto_adjust=False
             )["Close"]
 
+    # Pack daily closing prices into a compact ticker-indexed matrix
+    def build_price_matrix(self, dtype=np.float64):
+        self.price_matrix = PriceMatrix.from_frame(self.data_1d, dtype=dtype)
+
     # Compute top N highly correlated stock pairs
     def compute_high_corr_pairs(self, top_n=3000):
         start_time_corr = self.start_time
@@ -74,10 +83,36 @@ class SP500Data:
         stacked_corr = upper_corr_matrix.stack()
         sorted_corr = stacked_corr.sort_values(ascending=False)
         self.high_corr_pairs = sorted_corr.index[0:top_n].to_list()
+        self.pair_lags = {}
+
+    # Compute top N pairs by peak cross-correlation of returns over lags
+    # -max_lag..max_lag; the lag of each pair's peak goes into pair_lags
+    def compute_lead_lag_pairs(self, top_n=3000, max_lag=2):
+        start_time_corr = self.start_time
+        final_time_corr = self.end_time - pd.DateOffset(days=60)
+
+        data_1d_corr = self.data_1d.loc[start_time_corr:final_time_corr]
+        peak_corr, peak_lag = lead_lag_correlation(data_1d_corr.to_numpy(), max_lag)
+
+        # Upper triangle only, best pairs first
+        rows, cols = np.triu_indices(len(data_1d_corr.columns), k=1)
+        corr = peak_corr[rows, cols]
+        order = np.argsort(-np.nan_to_num(corr, nan=-np.inf), kind="stable")[:top_n]
+
+        tickers = data_1d_corr.columns
+        self.high_corr_pairs = [(tickers[rows[i]], tickers[cols[i]]) for i in order]
+        self.pair_lags = {
+            pair: int(peak_lag[rows[i], cols[i]])
+            for pair, i in zip(self.high_corr_pairs, order)
+        }
 
-    # Run the entire pipeline
-    def run_pipeline(self):
+    # Run the entire pipeline; max_lag > 0 switches to lead-lag discovery
+    def run_pipeline(self, max_lag=0):
         self.fetch_sp500_list()
         self.download_data()
-        self.compute_high_corr_pairs()
+        self.build_price_matrix()
+        if max_lag > 0:
+            self.compute_lead_lag_pairs(max_lag=max_lag)
+        else:
+            self.compute_high_corr_pairs()
 
@@ -1,110 +1,327 @@
 import pandas as pd
 import numpy as np
 
+from price_matrix import PriceMatrix, AnalysisScratch
+from risk_metrics import risk_metrics
+
 class PairTradingFinancialAnalysis:
     def __init__(self, pair, df_whole, window=10, zscore_threshold=2, 
-                 margin_init=10000, margin_ratio=0.25, neutral_threshold=1):
+                 margin_init=10000, margin_ratio=0.25, neutral_threshold=1,
+                 scratch=None, verbose=True, lag=0):
         self.stock1, self.stock2 = pair
-        self.df_pair = df_whole[[self.stock1, self.stock2]].copy()
+        # Accept a PriceMatrix (zero-copy column views) or a wide DataFrame
+        if isinstance(df_whole, PriceMatrix):
+            self.prices = df_whole
+        else:
+            self.prices = PriceMatrix.from_frame(df_whole[[self.stock1, self.stock2]])
+        self.price1, self.price2 = self.prices.pair(pair)
+        self.dates = self.prices.dates
         self.window = window
         self.zscore_threshold = zscore_threshold
         self.neutral_threshold = neutral_threshold
         self.margin_init = margin_init
         self.margin_ratio = margin_ratio
         self.margin = margin_init
+        # Lead-lag in days: > 0 means stock1 leads stock2, so the spread pairs
+        # stock1's price `lag` days ago with stock2's price today (< 0: reverse)
+        self.lag = lag
+        self.verbose = verbose # Print each trading signal in summarize_signals
+
+        # Intermediates live in (possibly shared) scratch buffers
+        self.scratch = scratch if scratch is not None else AnalysisScratch()
+        self.scratch.ensure(len(self.dates))
+        self.ratio = None
+        self.zscore = None
+        self.signal = None
+        self.segment_starts = None # Row position where each signal group starts
+        self.equity = None # Daily mark-to-market equity curve
+        self.in_market = None # True on days a position is held
+        self.metrics = {}
 
         self.df_signal_summary = pd.DataFrame()
         self.df_margin = pd.DataFrame()
 
+    # Pair prices plus whichever intermediates have been computed (copies)
+    @property
+    def df_pair(self):
+        df = pd.DataFrame({self.stock1: self.price1, self.stock2: self.price2},
+                          index=self.dates)
+        for name in ("ratio", "zscore", "signal"):
+            values = getattr(self, name)
+            if values is not None:
+                df[name] = values
+        return df
+
     def compute_zscore(self):
-        ratio = np.log(self.df_pair[self.stock1] / self.df_pair[self.stock2])
-        ma = ratio.rolling(window=self.window, min_periods=1).mean().shift(1)
-        msd = ratio.rolling(window=self.window, min_periods=1).std().shift(1)
-        zscore = (ratio - ma) / msd
-        self.df_pair["ratio"] = ratio
-        self.df_pair["zscore"] = zscore
+        n = len(self.dates)
+        buf = self.scratch
+        ratio = buf.ratio[:n]
+        zscore = buf.zscore[:n]
+        valid = buf.mask[0, :n]
+        small = buf.mask[1, :n]
+        x, cs, cs2, cnt, s, sq = (row[:n] for row in buf.work)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._lagged_ratio(ratio)
+            np.log(ratio, out=ratio)
+
+        # Rolling mean / std (min_periods=1) from running sums. Like pandas
+        # rolling, non-finite ratios (a zero price) are skipped as missing; an
+        # inf left in a running sum would poison every later window.
+        # The ratio is centred on its first valid value to limit cancellation.
+        np.isfinite(ratio, out=valid)
+        first = np.argmax(valid)
+        center = ratio[first] if valid[first] else 0.0
+        np.subtract(ratio, center, out=x)
+        np.logical_not(valid, out=small)
+        np.copyto(x, 0.0, where=small)
+        np.cumsum(x, out=cs)
+        np.square(x, out=x)
+        np.cumsum(x, out=cs2)
+        np.add.accumulate(valid, dtype=np.float64, out=cnt)
+
+        count = x
+        self._window_sum(cs, self.window, s)
+        self._window_sum(cs2, self.window, sq)
+        self._window_sum(cnt, self.window, count)
+
+        mean, var = cs, cs2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(s, count, out=mean)
+            np.multiply(s, mean, out=cnt)
+            np.subtract(sq, cnt, out=var)
+            # Treat windows with a (numerically) constant ratio as zero variance
+            np.multiply(sq, 1e-10, out=sq)
+            np.less_equal(var, sq, out=small)
+            np.copyto(var, 0.0, where=small)
+            np.subtract(count, 1.0, out=count)
+            np.divide(var, count, out=var)
+            np.less_equal(count, 0.0, out=small)
+            np.copyto(var, np.nan, where=small)
+            np.sqrt(var, out=var)
+            np.add(mean, center, out=mean)
+
+            # Shift by one row so today's z-score uses yesterday's statistics
+            zscore[0] = np.nan
+            np.subtract(ratio[1:], mean[:-1], out=zscore[1:])
+            np.divide(zscore[1:], var[:-1], out=zscore[1:])
+
+        self.ratio = ratio
+        self.zscore = zscore
+
+    # price1 / price2 with the leading stock shifted back by `lag` rows
+    def _lagged_ratio(self, out):
+        lag = abs(self.lag)
+        if lag == 0:
+            np.divide(self.price1, self.price2, out=out)
+            return
+        out[:lag] = np.nan
+        if self.lag > 0:
+            np.divide(self.price1[:-lag], self.price2[lag:], out=out[lag:])
+        else:
+            np.divide(self.price1[lag:], self.price2[:-lag], out=out[lag:])
+
+    # Trailing window sums from a running sum, written into `out`
+    @staticmethod
+    def _window_sum(running, window, out):
+        out[:window] = running[:window]
+        np.subtract(running[window:], running[:-window], out=out[window:])
 
     def generate_signals(self):
-        z = self.df_pair["zscore"]
-        self.df_pair['signal'] = np.select(
-            [(z > self.zscore_threshold) & (z < 5),
-             (z < -self.zscore_threshold) & (z > -5),
-             (z > -self.neutral_threshold) & (z < self.neutral_threshold)],
-            [-1, 1, 0], default=np.nan
-        )
-        self.df_pair['signal'] = self.df_pair['signal'].ffill().fillna(0)
+        n = len(self.dates)
+        buf = self.scratch
+        z = self.zscore
+        signal = buf.signal[:n]
+        hit = buf.mask[0, :n]
+        tmp = buf.mask[1, :n]
+
+        # Applied in reverse priority so earlier conditions win, as in np.select
+        signal.fill(np.nan)
+        for lower, upper, value in (
+            (-self.neutral_threshold, self.neutral_threshold, 0.0),
+            (-5, -self.zscore_threshold, 1.0),
+            (self.zscore_threshold, 5, -1.0),
+        ):
+            np.greater(z, lower, out=hit)
+            np.less(z, upper, out=tmp)
+            np.logical_and(hit, tmp, out=hit)
+            np.copyto(signal, value, where=hit)
+
+        # Forward fill, then fill the leading gap with 0
+        idx = buf.index[:n]
+        np.isnan(signal, out=hit)
+        np.copyto(idx, buf.positions[:n])
+        np.copyto(idx, 0, where=hit)
+        np.maximum.accumulate(idx, out=idx)
+        filled = buf.work[0, :n]
+        np.take(signal, idx, out=filled)
+        np.nan_to_num(filled, copy=False, nan=0.0)
+        signal[:] = filled
+        self.signal = signal
+
+    # First non-null value in each [start, end) segment, like groupby "first"
+    @staticmethod
+    def _first_valid(values, starts, ends):
+        firsts = values[starts].astype(np.float64)
+        missing = np.flatnonzero(np.isnan(firsts))
+        for i in missing:
+            segment = values[starts[i]:ends[i]]
+            found = np.flatnonzero(~np.isnan(segment))
+            if found.size:
+                firsts[i] = segment[found[0]]
+        return firsts
 
     def summarize_signals(self):
-        df = self.df_pair.copy()
-        df["signal_group"] = df["signal"].diff().ne(0).cumsum()
-        df["time"] = df.index
-
-        self.df_signal_summary = (
-            df.groupby("signal_group")
-              .agg({
-                  "signal": "first",
-                  "time": "first",
-                  self.stock1: "first",
-                  self.stock2: "first"
-              })
-              .reset_index(drop=True)
-        )
-        self.df_signal_summary.columns = ["signal", "time_start", "stock1_start_price", "stock2_start_price"]
+        n = len(self.dates)
+        signal = self.signal
+
+        # A new group starts wherever the signal changes
+        starts = np.flatnonzero(signal[1:] != signal[:-1]) + 1
+        starts = np.concatenate(([0], starts))
+        ends = np.append(starts[1:], n)
+        self.segment_starts = starts
 
-        # Add end time and prices
-        self.df_signal_summary["time_end"] = self.df_signal_summary["time_start"].shift(-1)
-        self.df_signal_summary["stock1_final_price"] = self.df_signal_summary["stock1_start_price"].shift(-1)
-        self.df_signal_summary["stock2_final_price"] = self.df_signal_summary["stock2_start_price"].shift(-1)
+        stock1_start = self._first_valid(self.price1, starts, ends)
+        stock2_start = self._first_valid(self.price2, starts, ends)
 
-        last_idx = self.df_signal_summary.index[-1]
-        self.df_signal_summary.loc[last_idx, "time_end"] = df.index[-1]
-        self.df_signal_summary.loc[last_idx, "stock1_final_price"] = df[self.stock1].iloc[-1]
-        self.df_signal_summary.loc[last_idx, "stock2_final_price"] = df[self.stock2].iloc[-1]
+        # End time and prices are the next group's start; the last group ends
+        # on the last row
+        self.df_signal_summary = pd.DataFrame({
+            "signal": signal[starts].astype(np.float64),
+            "time_start": self.dates[starts],
+            "stock1_start_price": stock1_start,
+            "stock2_start_price": stock2_start,
+            "time_end": self.dates[np.append(starts[1:], n - 1)],
+            "stock1_final_price": np.append(stock1_start[1:], self.price1[-1]),
+            "stock2_final_price": np.append(stock2_start[1:], self.price2[-1]),
+        })
+
+        if not self.verbose:
+            return
 
         # Print each trading signal
-        for _, row in self.df_signal_summary.iterrows():
-            if row["signal"] == 1:
-                print(f"Time: {row['time_start']} - Long {self.stock1}, Short {self.stock2}")
-            elif row["signal"] == -1:
-                print(f"Time: {row['time_start']} - Short {self.stock1}, Long {self.stock2}")
-            elif row["signal"] == 0:
-                print(f"Time: {row['time_start']} - Neutral (No position)")
+        for sig, time_start in zip(self.df_signal_summary["signal"],
+                                   self.df_signal_summary["time_start"]):
+            if sig == 1:
+                print(f"Time: {time_start} - Long {self.stock1}, Short {self.stock2}")
+            elif sig == -1:
+                print(f"Time: {time_start} - Short {self.stock1}, Long {self.stock2}")
+            elif sig == 0:
+                print(f"Time: {time_start} - Neutral (No position)")
 
 
     def calculate_margin(self):
-        summary = self.df_signal_summary.copy()
+        summary = self.df_signal_summary
         summary = summary[summary['signal'].isin([1, -1])].reset_index(drop=True)
         margin = self.margin_init
         buying_power = margin / self.margin_ratio
-        margins = []
+        margins, units1, units2, commissions = [], [], [], []
 
-        for _, row in summary.iterrows():
-            stock1_units = int((0.5 * buying_power) // row["stock1_start_price"])
-            stock2_units = int((0.5 * buying_power) // row["stock2_start_price"])
+        for signal, start1, final1, start2, final2 in zip(
+            summary["signal"].to_numpy(),
+            summary["stock1_start_price"].to_numpy(), summary["stock1_final_price"].to_numpy(),
+            summary["stock2_start_price"].to_numpy(), summary["stock2_final_price"].to_numpy()
+        ):
+            stock1_units = int((0.5 * buying_power) // start1)
+            stock2_units = int((0.5 * buying_power) // start2)
 
             # Simplified commission
-            commission = 0.001 * (row["stock1_start_price"] * stock1_units + row["stock2_start_price"] * stock2_units)
+            commission = 0.001 * (start1 * stock1_units + start2 * stock2_units)
 
-            if row["signal"] == 1:  # Long stock1, short stock2
-                pnl = ((row["stock1_final_price"] - row["stock1_start_price"]) * stock1_units -
-                       (row["stock2_final_price"] - row["stock2_start_price"]) * stock2_units)
+            if signal == 1:  # Long stock1, short stock2
+                pnl = (final1 - start1) * stock1_units - (final2 - start2) * stock2_units
             else:  # Short stock1, long stock2
-                pnl = ((row["stock2_final_price"] - row["stock2_start_price"]) * stock2_units -
-                       (row["stock1_final_price"] - row["stock1_start_price"]) * stock1_units)
+                pnl = (final2 - start2) * stock2_units - (final1 - start1) * stock1_units
 
             margin += pnl - commission
             margins.append(margin)
+            units1.append(stock1_units)
+            units2.append(stock2_units)
+            commissions.append(commission)
             buying_power = margin / self.margin_ratio
 
-        summary["margin"] = margins
+        summary["stock1_units"] = np.array(units1, dtype=np.int64)
+        summary["stock2_units"] = np.array(units2, dtype=np.int64)
+        summary["commission"] = np.array(commissions, dtype=np.float64)
+        summary["margin"] = np.array(margins, dtype=np.float64)
         self.df_margin = summary
         self.margin = margin
 
+    # Daily mark-to-market equity: flat at the realised margin between trades
+    # and on each entry day, margin - commission + open PnL at each later
+    # close while a trade is held, and exactly the calculate_margin value on
+    # the day a trade closes (also when it flips straight into the next one)
+    def compute_equity_curve(self):
+        n = len(self.dates)
+        starts = self.segment_starts
+        ends = np.append(starts[1:], n - 1)
+        trades = np.flatnonzero(np.isin(self.df_signal_summary["signal"].to_numpy(), (1, -1)))
+        price1 = self._ffill(self.price1)
+        price2 = self._ffill(self.price2)
+
+        trades_df = self.df_margin
+        signal = trades_df["signal"].to_numpy()
+        start1 = trades_df["stock1_start_price"].to_numpy()
+        final1 = trades_df["stock1_final_price"].to_numpy()
+        start2 = trades_df["stock2_start_price"].to_numpy()
+        final2 = trades_df["stock2_final_price"].to_numpy()
+        units1 = trades_df["stock1_units"].to_numpy()
+        units2 = trades_df["stock2_units"].to_numpy()
+        commission = trades_df["commission"].to_numpy()
+        margins = trades_df["margin"].to_numpy()
+
+        equity = np.empty(n)
+        in_market = np.zeros(n, dtype=bool)
+        margin = self.margin_init
+        flat_from = 0
+        for k, segment in enumerate(trades):
+            start, end = starts[segment], ends[segment]
+            # Flat up to and including the entry day, which may also be the
+            # previous trade's close day
+            equity[flat_from:start + 1] = margin
+
+            open_pnl = (
+                (price1[start + 1:end + 1] - start1[k]) * units1[k]
+                - (price2[start + 1:end + 1] - start2[k]) * units2[k]
+            )
+            equity[start + 1:end + 1] = margin - commission[k] + signal[k] * open_pnl
+            equity[end] = margins[k]
+            in_market[start:end] = True
+
+            margin = margins[k]
+            flat_from = end + 1
+        equity[flat_from:] = margin
+
+        self.equity = equity
+        self.in_market = in_market
+        self.traded_notional = float(
+            ((start1 + final1) * units1 + (start2 + final2) * units2).sum()
+        )
+        self.total_commission = float(commission.sum())
+
+    # Forward-filled copy of a price series (leading NaNs stay NaN)
+    @staticmethod
+    def _ffill(values):
+        idx = np.where(np.isnan(values), 0, np.arange(len(values)))
+        np.maximum.accumulate(idx, out=idx)
+        return values[idx].astype(np.float64)
+
+    # Risk metrics for this pair from the equity curve (see risk_metrics.py)
+    def compute_risk_metrics(self):
+        metrics = risk_metrics(
+            self.equity[:, None], self.in_market[:, None], [self.traded_notional],
+            [self.total_commission], [self.margin_init]
+        )
+        self.metrics = {name: float(values[0]) for name, values in metrics.items()}
+        return self.metrics
+
     def run_analysis(self):
         self.compute_zscore()
         self.generate_signals()
         self.summarize_signals()
         self.calculate_margin()
+        self.compute_equity_curve()
+        self.compute_risk_metrics()
         
         total_pnl = self.df_margin["margin"].iloc[-1] - self.margin_init
         
@@ -112,8 +329,11 @@ class PairTradingFinancialAnalysis:
             "pair": (self.stock1, self.stock2),
             "window": self.window,
             "zscore_threshold": self.zscore_threshold,
+            "lag": self.lag,
             "final_margin": self.margin,
             "total_pnl": total_pnl,
+            **self.metrics,
+            "equity_curve": pd.Series(self.equity, index=self.dates, name="equity"),
             "df_signal_summary": self.df_signal_summary
         }
 
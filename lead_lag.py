@@ -0,0 +1,79 @@
+import numpy as np
+
+# Cross-correlation of daily log returns for every ticker pair at lags
+# -max_lag..max_lag, computed with batched FFTs over the price matrix.
+#
+# values: (n_dates, n_tickers) prices, NaN where missing.
+# Returns (peak_corr, peak_lag), both (n_tickers, n_tickers): for tickers i, j
+# the highest correlation over the lag range and the lag where it occurs.
+# A positive lag k means ticker i leads ticker j by k days, i.e. returns of i
+# on day t line up with returns of j on day t + k.
+#
+# Each lag's correlation is the Pearson correlation over the days where both
+# returns exist, as pandas corr() does for same-day returns; lags with fewer
+# than min_periods overlapping days give NaN.
+def lead_lag_correlation(values, max_lag=2, block_size=32, min_periods=2):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(np.asarray(values, dtype=np.float64)), axis=0)
+
+    # Centre and scale each ticker's returns (Pearson is unaffected, but the
+    # sums below lose less precision); missing returns become 0 with mask 0
+    valid = np.isfinite(returns)
+    counts = np.maximum(valid.sum(axis=0), 1)
+    x = np.where(valid, returns, 0.0)
+    x = np.where(valid, x - x.sum(axis=0) / counts, 0.0)
+    scale = np.sqrt((x ** 2).sum(axis=0) / counts)
+    x = np.where(scale > 0, x / np.where(scale > 0, scale, 1.0), 0.0)
+    mask = valid.astype(np.float64)
+
+    n_obs, n_tickers = x.shape
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    # Zero-pad past n_obs + max_lag so circular wrap-around never reaches
+    # the lags we read back
+    nfft = 1 << (n_obs + max_lag).bit_length()
+    spectra = {
+        name: np.fft.rfft(series, n=nfft, axis=0).T # (n_tickers, n_freqs)
+        for name, series in (("x", x), ("xx", x ** 2), ("m", mask))
+    }
+
+    # Inverse real DFT evaluated only at the lags we need: one small
+    # (n_freqs, n_lags) basis instead of a full-length irfft per pair
+    freqs = np.arange(nfft // 2 + 1)
+    weights = np.where((freqs == 0) | (freqs == nfft // 2), 1.0, 2.0) / nfft
+    basis = weights[:, None] * np.exp(2j * np.pi * np.outer(freqs, lags % nfft) / nfft)
+
+    peak_corr = np.empty((n_tickers, n_tickers))
+    peak_lag = np.empty((n_tickers, n_tickers), dtype=np.int64)
+
+    # irfft(conj(A_i) * B_j)[k] = sum_t a_i[t] * b_j[t + k]; blocks of rows
+    # bound the size of the (block, n_tickers, n_freqs) cross-spectra
+    for start in range(0, n_tickers, block_size):
+        stop = min(start + block_size, n_tickers)
+
+        def lagged_sum(a, b):
+            cross = np.conj(spectra[a][start:stop, None, :]) * spectra[b][None, :, :]
+            return (cross @ basis).real
+
+        # Sums over the days where both tickers have a return
+        n = np.rint(lagged_sum("m", "m"))
+        sum_xy = lagged_sum("x", "x")
+        sum_x = lagged_sum("x", "m")
+        sum_y = lagged_sum("m", "x")
+        sum_xx = lagged_sum("xx", "m")
+        sum_yy = lagged_sum("m", "xx")
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = sum_xy - sum_x * sum_y / n
+            var_x = np.maximum(sum_xx - sum_x ** 2 / n, 0.0)
+            var_y = np.maximum(sum_yy - sum_y ** 2 / n, 0.0)
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[n < min_periods] = np.nan
+
+        ranked = np.where(np.isnan(corr), -np.inf, corr)
+        best = np.argmax(ranked, axis=-1)
+        peak = np.take_along_axis(corr, best[..., None], axis=-1)[..., 0]
+        peak_corr[start:stop] = peak
+        peak_lag[start:stop] = np.where(np.isnan(peak), 0, lags[best])
+
+    return peak_corr, peak_lag
@@ -0,0 +1,235 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from financial_analysis import PairTradingFinancialAnalysis
+from price_matrix import PriceMatrix, AnalysisScratch
+
+class LatencyHistogram:
+    # Power-of-two nanosecond buckets: bucket k counts latencies in [2^(k-1), 2^k)
+    def __init__(self, n_buckets=48):
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.total = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def record(self, latency_ns):
+        bucket = min(int(latency_ns).bit_length(), len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.total += 1
+        self.sum_ns += latency_ns
+        self.max_ns = max(self.max_ns, latency_ns)
+
+    # Upper bound (in microseconds) of the bucket holding the q-th quantile;
+    # the last bucket also holds everything larger, so it is bounded by the max
+    def quantile_us(self, q):
+        if self.total == 0:
+            return float("nan")
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * self.total))
+        if bucket == len(self.counts) - 1:
+            return self.max_ns / 1000
+        return min(1 << bucket, self.max_ns) / 1000
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean_us": self.sum_ns / self.total / 1000 if self.total else float("nan"),
+            "p50_us": self.quantile_us(0.50),
+            "p90_us": self.quantile_us(0.90),
+            "p99_us": self.quantile_us(0.99),
+            "max_us": self.max_ns / 1000,
+        }
+
+
+class LivePairSignal:
+    # Incremental version of compute_zscore + generate_signals for one pair:
+    # consumes one bar at a time and keeps only the last `window` ratios
+    def __init__(self, window=10, zscore_threshold=2, neutral_threshold=1):
+        self.window = window
+        self.zscore_threshold = zscore_threshold
+        self.neutral_threshold = neutral_threshold
+        self.ratios = deque(maxlen=window)
+        self.signal = 0.0
+
+    # Mean and sample std of the finite ratios currently in the window
+    # (pandas rolling skips inf as missing too)
+    def _stats(self):
+        values = [r for r in self.ratios if math.isfinite(r)]
+        if not values:
+            return math.nan, math.nan
+        mean = sum(values) / len(values)
+        if len(values) < 2:
+            return mean, math.nan
+        var = sum((r - mean) ** 2 for r in values) / (len(values) - 1)
+        return mean, math.sqrt(var)
+
+    def on_bar(self, price1, price2):
+        try:
+            ratio = math.log(float(price1) / float(price2))
+        except (ValueError, ZeroDivisionError):
+            ratio = math.nan
+
+        # Statistics of the previous `window` bars, as with .shift(1)
+        mean, std = self._stats()
+        diff = ratio - mean
+        if std == 0:
+            z = math.nan if diff == 0 or math.isnan(diff) else math.copysign(math.inf, diff)
+        else:
+            z = diff / std
+        self.ratios.append(ratio)
+
+        if self.zscore_threshold < z < 5:
+            self.signal = -1.0
+        elif -5 < z < -self.zscore_threshold:
+            self.signal = 1.0
+        elif -self.neutral_threshold < z < self.neutral_threshold:
+            self.signal = 0.0
+        # Otherwise keep the previous signal
+        return self.signal
+
+
+class MarketReplay:
+    # Streams stored bars through LivePairSignal for a set of pairs via an
+    # asyncio queue, measuring latency and throughput. `latency` runs from a
+    # bar being published to each pair's signal (tick-to-signal, including
+    # time spent queued); `processing` starts when the bar is taken off the
+    # queue.
+    # speed: market seconds replayed per wall-clock second (1 = real time,
+    # None = as fast as possible); bar_seconds is used when the date index
+    # is not made of timestamps.
+    def __init__(self, prices, pairs, window=10, zscore_threshold=2,
+                 neutral_threshold=1, speed=None, bar_seconds=86400, queue_size=256):
+        if not isinstance(prices, PriceMatrix):
+            prices = PriceMatrix.from_frame(prices)
+        self.prices = prices
+        self.pairs = [tuple(p) for p in pairs]
+        self.columns = [
+            (prices.ticker_index[s1], prices.ticker_index[s2]) for s1, s2 in self.pairs
+        ]
+        self.window = window
+        self.zscore_threshold = zscore_threshold
+        self.neutral_threshold = neutral_threshold
+        self.speed = speed
+        self.bar_seconds = bar_seconds
+        self.queue_size = queue_size
+
+        self.latency = LatencyHistogram()
+        self.processing = LatencyHistogram()
+        self.live_signals = np.empty((len(prices), len(self.pairs)))
+
+    # Market seconds between bar i - 1 and bar i
+    def _bar_seconds(self, i):
+        try:
+            return (self.prices.dates[i] - self.prices.dates[i - 1]).total_seconds()
+        except (AttributeError, TypeError):
+            return self.bar_seconds
+
+    async def _produce(self, queue):
+        loop = asyncio.get_running_loop()
+        values = self.prices.values
+        start = loop.time()
+        market_seconds = 0.0
+        for i in range(len(self.prices)):
+            if self.speed is not None:
+                # Each bar's deadline is fixed from the start, so time spent
+                # consuming is absorbed rather than added to every delay
+                if i > 0:
+                    market_seconds += self._bar_seconds(i)
+                delay = start + market_seconds / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await queue.put((i, values[i], time.perf_counter_ns()))
+        await queue.put(None)
+
+    async def _consume(self, queue):
+        states = [
+            LivePairSignal(self.window, self.zscore_threshold, self.neutral_threshold)
+            for _ in self.pairs
+        ]
+        while True:
+            bar = await queue.get()
+            if bar is None:
+                return
+            i, row, published_ns = bar
+            received_ns = time.perf_counter_ns()
+            for j, (state, (c1, c2)) in enumerate(zip(states, self.columns)):
+                self.live_signals[i, j] = state.on_bar(row[c1], row[c2])
+                done_ns = time.perf_counter_ns()
+                self.latency.record(done_ns - published_ns)
+                self.processing.record(done_ns - received_ns)
+
+    async def _replay(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        await asyncio.gather(self._produce(queue), self._consume(queue))
+
+    # Signals from the batch analysis, one column per pair
+    def batch_signals(self):
+        scratch = AnalysisScratch(len(self.prices))
+        signals = np.empty((len(self.prices), len(self.pairs)))
+        for j, pair in enumerate(self.pairs):
+            analysis = PairTradingFinancialAnalysis(
+                pair, self.prices, self.window, self.zscore_threshold,
+                neutral_threshold=self.neutral_threshold, scratch=scratch, verbose=False
+            )
+            analysis.compute_zscore()
+            analysis.generate_signals()
+            signals[:, j] = analysis.signal
+        return signals
+
+    # Replay every bar and return latency, throughput and divergence figures
+    def run(self):
+        self.latency = LatencyHistogram()
+        self.processing = LatencyHistogram()
+        start = time.perf_counter()
+        asyncio.run(self._replay())
+        elapsed = time.perf_counter() - start
+
+        batch = self.batch_signals()
+        rows, cols = np.nonzero(self.live_signals != batch)
+        divergences = [
+            {
+                "pair": self.pairs[j],
+                "time": self.prices.dates[i],
+                "live_signal": self.live_signals[i, j],
+                "batch_signal": batch[i, j],
+            }
+            for i, j in zip(rows, cols)
+        ]
+
+        pair_bars = len(self.prices) * len(self.pairs)
+        return {
+            "bars": len(self.prices),
+            "pairs": len(self.pairs),
+            "elapsed_seconds": elapsed,
+            "bars_per_second": pair_bars / elapsed if elapsed > 0 else float("inf"),
+            "latency": self.latency.summary(),
+            "latency_histogram": self.latency.counts.copy(),
+            "processing": self.processing.summary(),
+            "processing_histogram": self.processing.counts.copy(),
+            "divergences": divergences,
+        }
+
+
+def main():
+    from config import SP500Data
+
+    sp500_data = SP500Data()
+    sp500_data.run_pipeline()
+
+    replay = MarketReplay(sp500_data.price_matrix, sp500_data.high_corr_pairs[:100])
+    report = replay.run()
+
+    print("Market Replay Summary:")
+    print(f"Bars: {report['bars']} x Pairs: {report['pairs']}")
+    print(f"Throughput: {report['bars_per_second']:.0f} bars/sec")
+    for name in ("latency", "processing"):
+        stats = report[name]
+        print(f"{name.capitalize()} p50/p90/p99/max (us): {stats['p50_us']:.1f} / "
+              f"{stats['p90_us']:.1f} / {stats['p99_us']:.1f} / {stats['max_us']:.1f}")
+    print(f"Divergences from batch signals: {len(report['divergences'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+class PriceMatrix:
+    # Compact price container: one contiguous array, a ticker -> column index
+    # and a date index shared by every pair analysed from it
+    def __init__(self, values, tickers, dates, dtype=np.float64):
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim != 2:
+            raise ValueError("values must be a 2D array (dates x tickers)")
+        if values.shape != (len(dates), len(tickers)):
+            raise ValueError(
+                f"values shape {values.shape} does not match "
+                f"{len(dates)} dates x {len(tickers)} tickers"
+            )
+
+        # Column-major storage so every ticker column is itself contiguous
+        self.values = np.asfortranarray(values)
+        self.tickers = list(tickers)
+        self.ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.dates = pd.Index(dates)
+
+    # Build from a wide DataFrame such as SP500Data.data_1d
+    @classmethod
+    def from_frame(cls, df, dtype=np.float64):
+        return cls(df.to_numpy(dtype=dtype), df.columns, df.index, dtype=dtype)
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, ticker):
+        return ticker in self.ticker_index
+
+    # Zero-copy view of one ticker's price history
+    def column(self, ticker):
+        try:
+            return self.values[:, self.ticker_index[ticker]]
+        except KeyError:
+            raise KeyError(f"Ticker not in price matrix: {ticker}") from None
+
+    # Zero-copy views of both legs of a pair
+    def pair(self, pair):
+        stock1, stock2 = pair
+        return self.column(stock1), self.column(stock2)
+
+    # Rebuild a DataFrame (copies) for plotting or export
+    def to_frame(self, tickers=None):
+        if tickers is None:
+            return pd.DataFrame(self.values, index=self.dates, columns=self.tickers)
+        cols = [self.ticker_index[t] for t in tickers]
+        return pd.DataFrame(self.values[:, cols], index=self.dates, columns=list(tickers))
+
+
+class AnalysisScratch:
+    # Reusable float64 buffers for the per-pair intermediates.
+    # Pass one instance to many PairTradingFinancialAnalysis objects to avoid
+    # reallocating ratio / zscore / signal arrays for every pair. Results held
+    # in the buffers are only valid until the next analysis reuses them.
+    def __init__(self, length=0):
+        self.length = 0
+        self.ensure(length)
+
+    # Grow the buffers if a longer series is analysed; never shrinks
+    def ensure(self, length):
+        if length <= self.length:
+            return
+        self.length = length
+        self.ratio = np.empty(length)
+        self.zscore = np.empty(length)
+        self.signal = np.empty(length)
+        self.work = np.empty((6, length))
+        self.mask = np.empty((2, length), dtype=bool)
+        self.index = np.empty(length, dtype=np.intp)
+        self.positions = np.arange(length)
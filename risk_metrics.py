@@ -0,0 +1,49 @@
+import warnings
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+METRIC_NAMES = ("max_drawdown", "sharpe", "sortino", "turnover",
+                "time_in_market", "commission_drag")
+
+# Risk metrics for many pairs in one pass. Each column is one pair:
+#
+# equity: (n_dates, n_pairs) daily mark-to-market equity curves
+# in_market: (n_dates, n_pairs) True on days a position is held
+# traded_notional, commission, margin_init: (n_pairs,) per-pair totals
+#
+# Returns a dict of (n_pairs,) arrays:
+# max_drawdown      largest peak-to-trough loss as a fraction of the peak
+# sharpe / sortino  annualised mean daily return over its (downside) std
+# turnover          traded notional (entries + exits) over average equity
+# time_in_market    fraction of days with an open position
+# commission_drag   total commission as a fraction of the initial margin
+def risk_metrics(equity, in_market, traded_notional, commission, margin_init,
+                 periods_per_year=TRADING_DAYS):
+    equity = np.asarray(equity, dtype=np.float64)
+    in_market = np.asarray(in_market, dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # All-NaN columns (e.g. missing prices) just give NaN metrics
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        returns = np.diff(equity, axis=0) / equity[:-1]
+        mean = np.nanmean(returns, axis=0)
+        std = np.nanstd(returns, axis=0, ddof=1)
+        downside = np.sqrt(np.nanmean(np.minimum(returns, 0.0) ** 2, axis=0))
+        scale = np.sqrt(periods_per_year)
+
+        peak = np.fmax.accumulate(equity, axis=0)
+        drawdown = (peak - equity) / peak
+
+        return {
+            "max_drawdown": np.nanmax(drawdown, axis=0),
+            "sharpe": mean / std * scale,
+            "sortino": mean / downside * scale,
+            "turnover": np.asarray(traded_notional, dtype=np.float64)
+                        / np.nanmean(equity, axis=0),
+            "time_in_market": in_market.mean(axis=0),
+            "commission_drag": np.asarray(commission, dtype=np.float64)
+                               / np.asarray(margin_init, dtype=np.float64),
+        }
@@ -0,0 +1,312 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+import pandas as pd
+
+from batch_analysis import SegmentSpillWriter, iter_combination_results, parameter_grid
+from price_matrix import PriceMatrix, AnalysisScratch
+
+CHECKPOINT_FILE = "checkpoint.txt" # One completed shard id per line
+MANIFEST_FILE = "manifest.json"
+AUTHKEY_ENV = "PAIRS_AUTHKEY" # Fallback for --authkey; there is no default key
+
+# Split result ids 0..total-1 into contiguous shards of `shard_size`
+def make_shards(total, shard_size):
+    return [
+        (shard_id, start, min(start + shard_size, total))
+        for shard_id, start in enumerate(range(0, total, shard_size))
+    ]
+
+
+# Fingerprint of the job so a run directory is never resumed with other inputs
+def job_fingerprint(prices, pairs, param_sets, shard_size, pair_lags=None):
+    digest = hashlib.sha256()
+    digest.update(prices.values.tobytes())
+    digest.update(json.dumps([prices.tickers, [str(d) for d in prices.dates]]).encode())
+    digest.update(json.dumps([list(p) for p in pairs]).encode())
+    digest.update(json.dumps(param_sets, sort_keys=True).encode())
+    digest.update(str(shard_size).encode())
+    if pair_lags:
+        digest.update(json.dumps(sorted([list(p), lag] for p, lag in pair_lags.items())).encode())
+    return digest.hexdigest()
+
+
+def shard_path(run_dir, shard_id, suffix):
+    return os.path.join(run_dir, f"shard_{shard_id:06d}.{suffix}")
+
+
+class ShardCoordinator:
+    # Hands out shards to workers, writes their results and checkpoints them.
+    # A shard handed out but not completed within `lease_seconds` is handed out
+    # again, so a crashed worker only loses its current shard.
+    def __init__(self, run_dir, prices, pairs, param_sets, shard_size=100,
+                 lease_seconds=600, pair_lags=None):
+        if not isinstance(prices, PriceMatrix):
+            prices = PriceMatrix.from_frame(prices)
+        self.run_dir = run_dir
+        self.prices = prices
+        self.pairs = [tuple(p) for p in pairs]
+        self.param_sets = list(param_sets)
+        self.pair_lags = dict(pair_lags or {})
+        self.lease_seconds = lease_seconds
+        self.shards = make_shards(len(self.pairs) * len(self.param_sets), shard_size)
+
+        self._lock = threading.Lock()
+        self._leases = {} # shard_id -> time handed out
+        os.makedirs(run_dir, exist_ok=True)
+        self._check_manifest(job_fingerprint(
+            prices, self.pairs, self.param_sets, shard_size, self.pair_lags
+        ))
+        self.completed = self._read_checkpoint()
+
+    def _check_manifest(self, fingerprint):
+        path = os.path.join(self.run_dir, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path) as file:
+                manifest = json.load(file)
+            if manifest["fingerprint"] != fingerprint:
+                raise ValueError(f"Run directory {self.run_dir} belongs to a different job")
+            return
+        with open(path, "w") as file:
+            json.dump({"fingerprint": fingerprint, "n_shards": len(self.shards)}, file)
+
+    def _read_checkpoint(self):
+        path = os.path.join(self.run_dir, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return set()
+        with open(path) as file:
+            return {int(line) for line in file if line.strip()}
+
+    # Everything a worker needs to evaluate shards, sent once per worker
+    def get_job(self):
+        return {
+            "values": self.prices.values,
+            "tickers": self.prices.tickers,
+            "dates": self.prices.dates,
+            "pairs": self.pairs,
+            "param_sets": self.param_sets,
+            "pair_lags": self.pair_lags,
+        }
+
+    # Next (shard_id, start, stop) to evaluate, or None if nothing is free
+    def next_shard(self):
+        now = time.monotonic()
+        with self._lock:
+            for shard in self.shards:
+                shard_id = shard[0]
+                if shard_id in self.completed:
+                    continue
+                leased = self._leases.get(shard_id)
+                if leased is None or now - leased > self.lease_seconds:
+                    self._leases[shard_id] = now
+                    return shard
+        return None
+
+    # Store a shard's results, then record it in the checkpoint
+    def complete(self, shard_id, results, spill_bytes):
+        with self._lock:
+            if shard_id in self.completed:
+                return
+            # Write to temporary files and rename so a crash never leaves a
+            # half-written shard behind a checkpoint entry
+            for suffix, data, mode in (("json", json.dumps(results), "w"),
+                                       ("spill", spill_bytes, "wb")):
+                path = shard_path(self.run_dir, shard_id, suffix)
+                with open(path + ".tmp", mode) as file:
+                    file.write(data)
+                os.replace(path + ".tmp", path)
+            with open(os.path.join(self.run_dir, CHECKPOINT_FILE), "a") as file:
+                file.write(f"{shard_id}\n")
+            self.completed.add(shard_id)
+            self._leases.pop(shard_id, None)
+
+    def is_finished(self):
+        with self._lock:
+            return len(self.completed) == len(self.shards)
+
+
+# Worker side of the manager protocol. BaseManager.register writes to a
+# class-wide registry, so clients and servers never share a class.
+class CoordinatorClient(BaseManager):
+    pass
+
+CoordinatorClient.register("get_coordinator")
+
+
+# Serve a coordinator on (host, port) from a background thread.
+# Returns the manager server; its `address` holds the bound port.
+# The manager protocol uses pickle, so the authkey must be a shared secret:
+# anyone who can connect with it can run code on the other side.
+def serve_coordinator(coordinator, authkey, address=("127.0.0.1", 0)):
+    # A class per server, so several servers can live in one process
+    class CoordinatorServer(BaseManager):
+        pass
+
+    CoordinatorServer.register("get_coordinator", callable=lambda: coordinator)
+    manager = CoordinatorServer(address=address, authkey=authkey)
+    server = manager.get_server()
+    threading.Thread(target=_serve, args=(server,), daemon=True).start()
+    return server
+
+
+def _serve(server):
+    try:
+        server.serve_forever()
+    except SystemExit:
+        pass # serve_forever calls sys.exit once stop_event is set
+
+
+# Pull shards from a coordinator until every shard is complete
+def run_worker(address, authkey, poll_seconds=1.0):
+    manager = CoordinatorClient(address=tuple(address), authkey=authkey)
+    manager.connect()
+    coordinator = manager.get_coordinator()
+
+    job = coordinator.get_job()
+    prices = PriceMatrix(job["values"], job["tickers"], job["dates"],
+                         dtype=job["values"].dtype)
+    scratch = AnalysisScratch(len(prices))
+
+    while True:
+        shard = coordinator.next_shard()
+        if shard is None:
+            if coordinator.is_finished():
+                return
+            time.sleep(poll_seconds)
+            continue
+
+        shard_id, start, stop = shard
+        buffer = io.BytesIO()
+        # The shard is sent back as one list, so its risk metrics can be
+        # computed in a single vectorized pass at no cost to streaming
+        with SegmentSpillWriter(buffer) as spill:
+            results = [
+                {**result, "pair": list(result["pair"])}
+                for result in iter_combination_results(
+                    prices, job["pairs"], job["param_sets"], start, stop,
+                    spill=spill, scratch=scratch, pair_lags=job["pair_lags"],
+                    metrics_block=stop - start
+                )
+            ]
+        coordinator.complete(shard_id, results, buffer.getvalue())
+
+
+# Merge all shard results in shard order, one row per pair x parameter set
+def merge_results(run_dir):
+    shard_ids = sorted(
+        int(name[len("shard_"):-len(".json")])
+        for name in os.listdir(run_dir)
+        if name.startswith("shard_") and name.endswith(".json")
+    )
+    rows = []
+    for shard_id in shard_ids:
+        with open(shard_path(run_dir, shard_id, "json")) as file:
+            rows.extend(json.load(file))
+    for row in rows:
+        row["pair"] = tuple(row["pair"])
+    return pd.DataFrame(rows).sort_values("result_id").reset_index(drop=True)
+
+
+# Concatenate the shard spill files, in shard order, into one spill file
+def merge_spill(run_dir, out_path):
+    names = sorted(
+        name for name in os.listdir(run_dir)
+        if name.startswith("shard_") and name.endswith(".spill")
+    )
+    with open(out_path, "wb") as out:
+        for name in names:
+            with open(os.path.join(run_dir, name), "rb") as file:
+                out.write(file.read())
+
+
+# Run a whole job on this machine with `n_workers` worker processes talking
+# to an in-process coordinator over localhost, then merge the results.
+# Re-running with the same run_dir resumes from the checkpoint.
+def run_local(prices, pairs, param_sets, run_dir, n_workers=2, shard_size=100,
+              pair_lags=None):
+    coordinator = ShardCoordinator(run_dir, prices, pairs, param_sets, shard_size,
+                                   pair_lags=pair_lags)
+    authkey = os.urandom(32) # Fresh secret shared only with our own workers
+    server = serve_coordinator(coordinator, authkey)
+    try:
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(server.address, authkey))
+            for _ in range(n_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if not coordinator.is_finished():
+            raise RuntimeError("Workers exited before every shard was completed")
+    finally:
+        server.stop_event.set()
+    return merge_results(run_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded pair trading backtest")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coord = sub.add_parser("coordinator", help="Download data and serve shards")
+    coord.add_argument("--run-dir", required=True)
+    coord.add_argument("--host", default="127.0.0.1",
+                       help="Interface to listen on (use 0.0.0.0 for remote workers)")
+    coord.add_argument("--port", type=int, default=50000)
+    coord.add_argument("--top-n", type=int, default=3000)
+    coord.add_argument("--shard-size", type=int, default=100)
+    coord.add_argument("--max-lag", type=int, default=0,
+                       help="Discover lead-lag pairs up to this many days")
+
+    work = sub.add_parser("worker", help="Pull shards from a coordinator")
+    work.add_argument("--host", required=True)
+    work.add_argument("--port", type=int, default=50000)
+
+    for role in (coord, work):
+        role.add_argument("--authkey", default=os.environ.get(AUTHKEY_ENV),
+                          help=f"Shared secret (or set {AUTHKEY_ENV})")
+
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error(f"--authkey or the {AUTHKEY_ENV} environment variable is required")
+    authkey = args.authkey.encode()
+
+    if args.role == "worker":
+        run_worker((args.host, args.port), authkey)
+        return
+
+    from config import SP500Data
+
+    sp500_data = SP500Data()
+    sp500_data.run_pipeline()
+    if args.max_lag > 0:
+        sp500_data.compute_lead_lag_pairs(top_n=args.top_n, max_lag=args.max_lag)
+    else:
+        sp500_data.compute_high_corr_pairs(top_n=args.top_n)
+    param_sets = parameter_grid(window=(5, 10, 20), zscore_threshold=(1.5, 2, 2.5))
+
+    coordinator = ShardCoordinator(
+        args.run_dir, sp500_data.price_matrix, sp500_data.high_corr_pairs,
+        param_sets, args.shard_size, pair_lags=sp500_data.pair_lags
+    )
+    server = serve_coordinator(coordinator, authkey, (args.host, args.port))
+    print(f"Serving {len(coordinator.shards)} shards on {server.address}")
+    while not coordinator.is_finished():
+        time.sleep(5)
+    time.sleep(5) # Let polling workers see the job is finished before stopping
+    server.stop_event.set()
+
+    results = merge_results(args.run_dir)
+    results.to_csv(os.path.join(args.run_dir, "results.csv"), index=False)
+    merge_spill(args.run_dir, os.path.join(args.run_dir, "segments.spill"))
+    print(f"Completed {len(results)} pair / parameter combinations")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Factory for a random-walk price frame on business days with tickers
+# T0..T{n_tickers - 1} and `n_gaps` prices set to NaN
+@pytest.fixture(scope="session")
+def random_prices():
+    def make(seed=0, n_dates=300, n_tickers=8, n_gaps=0):
+        rng = np.random.default_rng(seed)
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_dates, n_tickers)), axis=0))
+        prices[rng.integers(0, n_dates, n_gaps), rng.integers(0, n_tickers, n_gaps)] = np.nan
+        return pd.DataFrame(prices, index=pd.bdate_range("2023-01-02", periods=n_dates),
+                            columns=[f"T{i}" for i in range(n_tickers)])
+    return make
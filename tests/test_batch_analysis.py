@@ -0,0 +1,104 @@
+import gc
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import batch_analysis
+from batch_analysis import (SegmentSpillWriter, iter_analysis_results,
+                            iter_combination_results, parameter_grid, read_spill)
+from price_matrix import PriceMatrix
+
+PAIRS = [("T0", "T1"), ("T2", "T3"), ("T4", "T5")]
+
+
+def test_spill_batches_never_exceed_batch_rows(random_prices, tmp_path):
+    df = random_prices()
+    path = tmp_path / "segments.spill"
+    with SegmentSpillWriter(path, batch_rows=50) as spill:
+        results = list(iter_analysis_results(df, PAIRS, parameter_grid(window=(5, 10)),
+                                             spill=spill))
+
+    batches = list(read_spill(path, df.index))
+    assert all(len(batch) <= 50 for batch in batches)
+    assert all(len(batch) == 50 for batch in batches[:-1])
+    segments = pd.concat(batches)
+    assert len(segments) == sum(result["n_segments"] for result in results)
+    assert segments["result_id"].is_monotonic_increasing
+
+
+def test_spill_refuses_non_empty_file_without_append(random_prices, tmp_path):
+    df = random_prices()
+    path = tmp_path / "segments.spill"
+    with SegmentSpillWriter(path) as spill:
+        first = list(iter_analysis_results(df, PAIRS[:1], parameter_grid(), spill=spill))
+
+    with pytest.raises(FileExistsError):
+        SegmentSpillWriter(path)
+
+    with SegmentSpillWriter(path, append=True) as spill:
+        list(iter_analysis_results(df, PAIRS[:1], parameter_grid(), spill=spill))
+    segments = pd.concat(read_spill(path))
+    assert len(segments) == 2 * first[0]["n_segments"]
+
+
+def test_param_sets_may_leave_out_defaults(random_prices):
+    df = random_prices()
+    (result,) = iter_analysis_results(df, PAIRS[:1], [{"window": 5}])
+    assert result["window"] == 5
+    assert result["total_pnl"] == result["final_margin"] - 10000
+    assert "max_drawdown" in result
+
+
+def test_results_are_yielded_as_each_analysis_finishes(random_prices, tmp_path, monkeypatch):
+    created = []
+
+    class CountedAnalysis(batch_analysis.PairTradingFinancialAnalysis):
+        def __init__(self, *args, **kwargs):
+            created.append(args[0])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(batch_analysis, "PairTradingFinancialAnalysis", CountedAnalysis)
+    df = random_prices()
+    path = tmp_path / "segments.spill"
+    with SegmentSpillWriter(path, batch_rows=1) as spill:
+        results = iter_analysis_results(df, PAIRS, parameter_grid(), spill=spill)
+        first = next(results)
+        # Only the first analysis has run when its result arrives
+        assert created == [PAIRS[0]]
+        assert spill.rows_written == first["n_segments"]
+        assert len(pd.concat(read_spill(path))) == first["n_segments"]
+        results.close()
+
+
+def test_metrics_block_does_not_change_results(random_prices):
+    df = random_prices()
+    grid = parameter_grid(window=(5, 10))
+    one = pd.DataFrame(list(iter_analysis_results(df, PAIRS, grid)))
+    blocked = pd.DataFrame(list(iter_analysis_results(df, PAIRS, grid, metrics_block=4)))
+    pd.testing.assert_frame_equal(one, blocked)
+
+
+def test_memory_stays_flat_with_more_combinations(random_prices, tmp_path):
+    prices = PriceMatrix.from_frame(random_prices(n_dates=1000))
+    pairs = [(f"T{i}", f"T{j}") for i in range(8) for j in range(i + 1, 8)]
+    grid = parameter_grid(window=(5, 10), zscore_threshold=(1.5, 2, 2.5))
+
+    # Peak traced bytes while streaming combinations [0, n) to a spill file;
+    # the spill buffer is bounded by batch_rows, not by n
+    def peak_bytes(n):
+        path = tmp_path / "segments.spill"
+        path.unlink(missing_ok=True)
+        gc.collect()
+        tracemalloc.start()
+        with SegmentSpillWriter(path, batch_rows=256) as spill:
+            for _ in iter_combination_results(prices, pairs, grid, 0, n, spill=spill):
+                pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    peak_bytes(8) # Warm up one-off caches
+    small, large = peak_bytes(8), peak_bytes(80)
+    # Holding every segment in memory instead would make `large` about 7x `small`
+    assert large < 1.5 * small
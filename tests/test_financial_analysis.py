@@ -0,0 +1,152 @@
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from financial_analysis import PairTradingFinancialAnalysis
+from price_matrix import PriceMatrix, AnalysisScratch
+
+# Pandas reference: the original DataFrame pipeline the numpy code replaced
+def reference_analysis(pair, df, window, zscore_threshold, neutral_threshold,
+                       margin_init=10000, margin_ratio=0.25):
+    stock1, stock2 = pair
+    df = df[[stock1, stock2]].copy()
+    with np.errstate(divide="ignore"):
+        ratio = np.log(df[stock1] / df[stock2])
+    ma = ratio.rolling(window=window, min_periods=1).mean().shift(1)
+    msd = ratio.rolling(window=window, min_periods=1).std().shift(1)
+    z = (ratio - ma) / msd
+    df["zscore"] = z
+    df["signal"] = np.select(
+        [(z > zscore_threshold) & (z < 5),
+         (z < -zscore_threshold) & (z > -5),
+         (z > -neutral_threshold) & (z < neutral_threshold)],
+        [-1, 1, 0], default=np.nan
+    )
+    df["signal"] = df["signal"].ffill().fillna(0)
+
+    df["signal_group"] = df["signal"].diff().ne(0).cumsum()
+    df["time"] = df.index
+    summary = (
+        df.groupby("signal_group")
+          .agg({"signal": "first", "time": "first", stock1: "first", stock2: "first"})
+          .reset_index(drop=True)
+    )
+    summary.columns = ["signal", "time_start", "stock1_start_price", "stock2_start_price"]
+    summary["time_end"] = summary["time_start"].shift(-1)
+    summary["stock1_final_price"] = summary["stock1_start_price"].shift(-1)
+    summary["stock2_final_price"] = summary["stock2_start_price"].shift(-1)
+    last = summary.index[-1]
+    summary.loc[last, "time_end"] = df.index[-1]
+    summary.loc[last, "stock1_final_price"] = df[stock1].iloc[-1]
+    summary.loc[last, "stock2_final_price"] = df[stock2].iloc[-1]
+
+    margin = margin_init
+    for _, row in summary[summary["signal"].isin([1, -1])].iterrows():
+        buying_power = margin / margin_ratio
+        units1 = int((0.5 * buying_power) // row["stock1_start_price"])
+        units2 = int((0.5 * buying_power) // row["stock2_start_price"])
+        commission = 0.001 * (row["stock1_start_price"] * units1 + row["stock2_start_price"] * units2)
+        pnl = ((row["stock1_final_price"] - row["stock1_start_price"]) * units1 -
+               (row["stock2_final_price"] - row["stock2_start_price"]) * units2)
+        margin += row["signal"] * pnl - commission
+    return df["zscore"].to_numpy(), df["signal"].to_numpy(), summary, margin
+
+
+def run_pipeline(analysis):
+    analysis.compute_zscore()
+    analysis.generate_signals()
+    analysis.summarize_signals()
+    analysis.calculate_margin()
+    return analysis
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("window,zscore_threshold,neutral_threshold",
+                         [(3, 2, 1), (10, 2, 1), (25, 1.5, 0.5), (10, 1, 1.2)])
+def test_matches_pandas_reference(random_prices, seed, window, zscore_threshold,
+                                  neutral_threshold):
+    df = random_prices(seed, n_dates=400, n_tickers=12, n_gaps=20)
+    # Zero prices give +inf (T0 / T1) and -inf (T2 / T3) log ratios, which
+    # pandas rolling skips as missing
+    df.iloc[50, 1] = 0.0
+    df.iloc[120, 2] = 0.0
+    prices = PriceMatrix.from_frame(df)
+    scratch = AnalysisScratch()
+    for pair in [("T0", "T1"), ("T2", "T3"), ("T5", "T4")]:
+        z, signal, summary, margin = reference_analysis(
+            pair, df, window, zscore_threshold, neutral_threshold
+        )
+        analysis = run_pipeline(PairTradingFinancialAnalysis(
+            pair, prices, window, zscore_threshold, neutral_threshold=neutral_threshold,
+            scratch=scratch, verbose=False
+        ))
+        # Running sums round differently from pandas rolling; signals must still agree
+        np.testing.assert_allclose(analysis.zscore, z, rtol=1e-6, atol=1e-9)
+        np.testing.assert_array_equal(analysis.signal, signal)
+        pd.testing.assert_frame_equal(analysis.df_signal_summary, summary, check_dtype=False)
+        assert analysis.margin == pytest.approx(margin, rel=1e-12, nan_ok=True)
+
+
+def test_dataframe_and_float32_inputs(random_prices):
+    df = random_prices(7, n_dates=400, n_tickers=12)
+    z, signal, summary, _ = reference_analysis(("T0", "T1"), df, 10, 2, 1)
+
+    from_frame = run_pipeline(PairTradingFinancialAnalysis(("T0", "T1"), df, verbose=False))
+    np.testing.assert_array_equal(from_frame.signal, signal)
+
+    float32 = PriceMatrix.from_frame(df, dtype=np.float32)
+    analysis = PairTradingFinancialAnalysis(("T0", "T1"), float32, verbose=False)
+    analysis.compute_zscore()
+    np.testing.assert_allclose(analysis.zscore, z, atol=1e-4)
+
+
+# Peak traced bytes for one pair's signal stages, averaged over the pairs
+def peak_bytes_per_pair(run, pairs):
+    peaks = []
+    tracemalloc.start()
+    for pair in pairs:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run(pair)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+def test_allocations_per_pair(random_prices):
+    df = random_prices(11, n_dates=5000, n_tickers=20, n_gaps=20)
+    prices = PriceMatrix.from_frame(df)
+    scratch = AnalysisScratch(len(prices))
+    pairs = [(f"T{i}", f"T{i + 1}") for i in range(0, 20, 2)]
+
+    def pandas_signals(pair):
+        reference_analysis(pair, df, 10, 2, 1)
+
+    def matrix_signals(pair):
+        analysis = PairTradingFinancialAnalysis(pair, prices, scratch=scratch, verbose=False)
+        run_pipeline(analysis)
+
+    reference = peak_bytes_per_pair(pandas_signals, pairs)
+    matrix = peak_bytes_per_pair(matrix_signals, pairs)
+    assert matrix < reference / 2
+
+
+def test_equity_equals_margin_on_every_close_day(random_prices):
+    df = random_prices(3, n_tickers=12)
+    analysis = run_pipeline(PairTradingFinancialAnalysis(
+        ("T0", "T1"), df, window=5, zscore_threshold=1, neutral_threshold=0.2, verbose=False
+    ))
+    analysis.compute_equity_curve()
+
+    summary = analysis.df_signal_summary
+    close_rows = analysis.dates.get_indexer(summary["time_end"])
+    trades = summary["signal"].isin([1, -1]).to_numpy()
+    signal = summary["signal"].to_numpy()
+    # The case must include a trade that flips straight into the opposite one
+    assert np.any(trades[:-1] & (signal[:-1] == -signal[1:]) & (signal[1:] != 0))
+
+    np.testing.assert_array_equal(analysis.equity[close_rows[trades]],
+                                  analysis.df_margin["margin"].to_numpy())
+    assert analysis.equity[-1] == analysis.margin
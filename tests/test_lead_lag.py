@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lead_lag import lead_lag_correlation
+
+
+def lead_lag_prices(seed=3, n_dates=400, n_tickers=12, n_gaps=40):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.01, (n_dates, n_tickers))
+    returns[2:, 1] = 0.8 * returns[:-2, 0] + 0.2 * returns[2:, 1] # T0 leads T1 by 2
+    returns[:-1, 3] = 0.8 * returns[1:, 2] + 0.2 * returns[:-1, 3] # T3 leads T2 by 1
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    prices[rng.integers(0, n_dates, n_gaps), rng.integers(0, n_tickers, n_gaps)] = np.nan
+    return prices
+
+
+@pytest.mark.parametrize("n_gaps", [0, 40])
+def test_matches_pandas_corr_at_each_lag(n_gaps):
+    prices = lead_lag_prices(n_gaps=n_gaps)
+    returns = pd.DataFrame(np.diff(np.log(prices), axis=0))
+
+    # Same-day correlation equals pandas pairwise-complete corr()
+    peak_corr, _ = lead_lag_correlation(prices, max_lag=0, block_size=5)
+    np.testing.assert_allclose(peak_corr, returns.corr().to_numpy(), atol=1e-10)
+
+    # Every lag in the range: compare the pairwise-complete correlation of
+    # returns i on day t with returns j on day t + k
+    max_lag = 2
+    peak_corr, peak_lag = lead_lag_correlation(prices, max_lag=max_lag, block_size=5)
+    for i, j in [(0, 1), (2, 3), (4, 7)]:
+        by_lag = {
+            k: returns[i].corr(returns[j].shift(-k)) for k in range(-max_lag, max_lag + 1)
+        }
+        best = max(by_lag, key=by_lag.get)
+        assert peak_lag[i, j] == best
+        assert peak_corr[i, j] == pytest.approx(by_lag[best], abs=1e-10)
+
+
+def test_finds_planted_leads():
+    peak_corr, peak_lag = lead_lag_correlation(lead_lag_prices(), max_lag=3)
+    assert peak_lag[0, 1] == 2 and peak_lag[1, 0] == -2
+    assert peak_lag[2, 3] == -1
+    assert peak_corr[0, 1] > 0.9
@@ -0,0 +1,102 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from market_replay import LatencyHistogram, LivePairSignal, MarketReplay
+
+PAIRS = [("T0", "T1"), ("T2", "T3"), ("T5", "T4"), ("T6", "T7")]
+
+
+@pytest.mark.parametrize("n_gaps", [0, 20])
+@pytest.mark.parametrize("window,zscore_threshold,neutral_threshold",
+                         [(3, 2, 1), (10, 2, 1), (25, 1.5, 0.5)])
+def test_live_signals_match_batch(random_prices, n_gaps, window, zscore_threshold,
+                                  neutral_threshold):
+    df = random_prices(4, n_gaps=n_gaps)
+    # Zero prices give infinite log ratios on both sides
+    df.iloc[50, 1] = 0.0
+    df.iloc[120, 2] = 0.0
+    replay = MarketReplay(df, PAIRS, window, zscore_threshold, neutral_threshold)
+    report = replay.run()
+
+    assert report["divergences"] == []
+    np.testing.assert_array_equal(replay.live_signals, replay.batch_signals())
+    assert report["bars"] == len(df) and report["pairs"] == len(PAIRS)
+    assert report["latency"]["count"] == len(df) * len(PAIRS)
+
+
+def test_live_pair_signal_keeps_signal_between_thresholds():
+    live = LivePairSignal(window=3, zscore_threshold=2, neutral_threshold=1)
+    for price in (100, 110, 100, 110):
+        live.on_bar(price, 100)
+    assert live.on_bar(130, 100) == -1.0 # z above the threshold
+    assert live.on_bar(math.nan, 100) == -1.0 # Missing price keeps the position
+
+
+def test_divergences_report_each_mismatch(random_prices):
+    class PlantedMismatch(MarketReplay):
+        def batch_signals(self):
+            signals = super().batch_signals()
+            signals[40, 1] = 5.0
+            return signals
+
+    df = random_prices(4)
+    replay = PlantedMismatch(df, PAIRS)
+    (divergence,) = replay.run()["divergences"]
+    assert divergence == {
+        "pair": PAIRS[1],
+        "time": df.index[40],
+        "live_signal": replay.live_signals[40, 1],
+        "batch_signal": 5.0,
+    }
+
+
+def test_latency_histogram_buckets_and_quantiles():
+    histogram = LatencyHistogram(n_buckets=24)
+    assert math.isnan(histogram.quantile_us(0.5))
+
+    for latency_ns in [1_000] * 90 + [1_000_000] * 9 + [0]:
+        histogram.record(latency_ns)
+    histogram.record(1 << 40) # Beyond the last bucket
+
+    expected = np.zeros(24, dtype=np.int64)
+    expected[[0, 10, 20, 23]] = [1, 90, 9, 1] # bucket k holds [2^(k-1), 2^k)
+    np.testing.assert_array_equal(histogram.counts, expected)
+
+    assert histogram.quantile_us(0.5) == 1.024
+    assert histogram.quantile_us(0.95) == 1024 * 1024 / 1000
+    assert histogram.quantile_us(1.0) == (1 << 40) / 1000 # Capped at the max
+
+    summary = histogram.summary()
+    assert summary["count"] == 101
+    assert summary["mean_us"] == pytest.approx((90_000 + 9_000_000 + (1 << 40)) / 101 / 1000)
+    assert summary["max_us"] == (1 << 40) / 1000
+
+
+def test_speed_paces_bars_by_market_time(random_prices):
+    df = random_prices(4, n_dates=20)
+    speed = 86400 / 0.01 # One market day per 10 ms, so weekends take 30 ms
+    replay = MarketReplay(df, PAIRS, speed=speed)
+    target = (df.index[-1] - df.index[0]).total_seconds() / speed
+    elapsed = replay.run()["elapsed_seconds"]
+    assert target <= elapsed < target + 0.1
+
+
+def test_speed_absorbs_consumer_time(random_prices, monkeypatch):
+    on_bar = LivePairSignal.on_bar
+
+    def slow_on_bar(self, price1, price2):
+        time.sleep(0.0003)
+        return on_bar(self, price1, price2)
+
+    monkeypatch.setattr(LivePairSignal, "on_bar", slow_on_bar)
+    df = random_prices(4, n_dates=100).reset_index(drop=True)
+    # 2 ms per bar, of which the consumer spends about 1.2 ms on four pairs;
+    # sleeping a relative delay per bar would finish about 0.1 s late
+    replay = MarketReplay(df, PAIRS, speed=500, bar_seconds=1)
+    target = (len(df) - 1) / 500
+    elapsed = replay.run()["elapsed_seconds"]
+    assert target <= elapsed < target + 0.05
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_metrics import METRIC_NAMES, TRADING_DAYS, risk_metrics
+
+
+def test_metrics_match_pandas():
+    rng = np.random.default_rng(5)
+    equity = pd.DataFrame({
+        "known": [100.0, 110, 99, 120, 90, 95, 95, 101, 98, 104],
+        "random": 100 * np.exp(np.cumsum(rng.normal(0, 0.03, 10))),
+        "no_trades": 10000.0,
+    })
+    in_market = pd.DataFrame({
+        "known": [False, True, True, True, True, False, False, True, True, False],
+        "random": [True] * 10,
+        "no_trades": [False] * 10,
+    })
+    traded_notional = np.array([400.0, 900.0, 0.0])
+    commission = np.array([0.4, 0.9, 0.0])
+    margin_init = np.array([100.0, 100.0, 10000.0])
+
+    metrics = risk_metrics(equity.to_numpy(), in_market.to_numpy(), traded_notional,
+                           commission, margin_init)
+    assert set(metrics) == set(METRIC_NAMES)
+
+    returns = equity.pct_change().iloc[1:]
+    downside = np.sqrt((returns.clip(upper=0) ** 2).mean())
+    expected = pd.DataFrame({
+        "max_drawdown": (1 - equity / equity.cummax()).max(),
+        "sharpe": returns.mean() / returns.std() * np.sqrt(TRADING_DAYS),
+        "sortino": returns.mean() / downside * np.sqrt(TRADING_DAYS),
+        "turnover": traded_notional / equity.mean(),
+        "time_in_market": in_market.mean(),
+        "commission_drag": commission / margin_init,
+    })
+    for name in METRIC_NAMES:
+        np.testing.assert_allclose(metrics[name], expected[name], rtol=1e-12, err_msg=name)
+
+    # Peak 120 to trough 90
+    assert metrics["max_drawdown"][0] == pytest.approx(0.25)
+    assert metrics["time_in_market"][0] == 0.6
+
+    # A pair that never trades has a flat curve: no return to scale
+    assert np.isnan(metrics["sharpe"][2]) and np.isnan(metrics["sortino"][2])
+    assert metrics["time_in_market"][2] == 0
+    assert metrics["max_drawdown"][2] == 0
+    assert metrics["turnover"][2] == 0 and metrics["commission_drag"][2] == 0
@@ -0,0 +1,94 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from batch_analysis import iter_analysis_results, parameter_grid
+from sharded_runner import (CHECKPOINT_FILE, ShardCoordinator, merge_results, merge_spill,
+                            run_local, run_worker, serve_coordinator, shard_path)
+
+SHARD_SIZE = 7
+
+
+@pytest.fixture(scope="module")
+def job(random_prices):
+    prices = random_prices(1, n_dates=250, n_tickers=10)
+    pairs = [(f"T{i}", f"T{j}") for i in range(10) for j in range(i + 1, 10)][:12]
+    param_sets = parameter_grid(window=(5, 10), zscore_threshold=(1.5, 2))
+    return prices, pairs, param_sets
+
+
+def test_results_identical_for_any_worker_count(job, tmp_path):
+    prices, pairs, param_sets = job
+    expected = pd.DataFrame(list(iter_analysis_results(prices, pairs, param_sets)))
+
+    spills = []
+    for n_workers in (1, 3):
+        run_dir = tmp_path / f"workers_{n_workers}"
+        results = run_local(prices, pairs, param_sets, run_dir, n_workers=n_workers,
+                            shard_size=SHARD_SIZE)
+        pd.testing.assert_frame_equal(results, expected)
+        merge_spill(run_dir, run_dir / "segments.spill")
+        spills.append((run_dir / "segments.spill").read_bytes())
+    assert spills[0] == spills[1]
+
+
+def test_resume_reruns_only_unfinished_shards(job, tmp_path):
+    prices, pairs, param_sets = job
+    expected = run_local(prices, pairs, param_sets, tmp_path, n_workers=2,
+                         shard_size=SHARD_SIZE)
+
+    # Simulate a crash: the last three shards never reached the checkpoint
+    checkpoint = tmp_path / CHECKPOINT_FILE
+    done = checkpoint.read_text().split()
+    kept, lost = done[:-3], [int(shard_id) for shard_id in done[-3:]]
+    checkpoint.write_text("".join(f"{shard_id}\n" for shard_id in kept))
+    for shard_id in lost:
+        os.remove(shard_path(tmp_path, shard_id, "json"))
+    kept_mtimes = {
+        shard_id: os.stat(shard_path(tmp_path, int(shard_id), "json")).st_mtime_ns
+        for shard_id in kept
+    }
+
+    coordinator = ShardCoordinator(tmp_path, prices, pairs, param_sets, SHARD_SIZE)
+    assert len(coordinator.shards) - len(coordinator.completed) == 3
+
+    resumed = run_local(prices, pairs, param_sets, tmp_path, n_workers=2,
+                        shard_size=SHARD_SIZE)
+    pd.testing.assert_frame_equal(resumed, expected)
+    for shard_id, mtime in kept_mtimes.items():
+        assert os.stat(shard_path(tmp_path, int(shard_id), "json")).st_mtime_ns == mtime
+
+
+def test_run_dir_rejects_a_different_job(job, tmp_path):
+    prices, pairs, param_sets = job
+    ShardCoordinator(tmp_path, prices, pairs, param_sets, SHARD_SIZE)
+    with pytest.raises(ValueError):
+        ShardCoordinator(tmp_path, prices, pairs[:-1], param_sets, SHARD_SIZE)
+
+
+def test_servers_and_workers_share_one_process(job, tmp_path):
+    prices, pairs, param_sets = job
+    expected = pd.DataFrame(list(iter_analysis_results(prices, pairs, param_sets)))
+
+    # Two coordinators for different jobs, each with a worker thread, all in
+    # this process: every worker must reach its own coordinator
+    jobs = {"all": pairs, "half": pairs[:6]}
+    authkey = os.urandom(32)
+    servers, workers = [], []
+    for name, job_pairs in jobs.items():
+        coordinator = ShardCoordinator(tmp_path / name, prices, job_pairs, param_sets,
+                                       SHARD_SIZE)
+        servers.append(serve_coordinator(coordinator, authkey))
+    for server in servers:
+        workers.append(threading.Thread(target=run_worker, args=(server.address, authkey)))
+        workers[-1].start()
+    for worker in workers:
+        worker.join()
+    for server in servers:
+        server.stop_event.set()
+
+    pd.testing.assert_frame_equal(merge_results(tmp_path / "all"), expected)
+    half = expected[expected["result_id"] < 6 * len(param_sets)]
+    pd.testing.assert_frame_equal(merge_results(tmp_path / "half"), half)
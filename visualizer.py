@@ -101,12 +101,18 @@ class StockPairVisualizer:
         # Build multi-line result text
         result_text = (
             f"Window: {result['window']}<br>"
+            f"Lag: {result['lag']}<br>"
             f"Z-Score Threshold: {result['zscore_threshold']}<br>"
             f"Neutral Threshold: {result['neutral_threshold']}<br>"
             f"Initial Margin: {result['margin_init']:.2f}<br>"
             f"Margin Ratio: {result['margin_ratio']:.2f}<br>"
             f"<b>Final Margin: {result['final_margin']:.2f}</b><br>"
-            f"<b>Total PnL: {result['total_pnl']:.2f}</b>"
+            f"<b>Total PnL: {result['total_pnl']:.2f}</b><br>"
+            f"Max Drawdown: {result['max_drawdown']:.2%}<br>"
+            f"Sharpe / Sortino: {result['sharpe']:.2f} / {result['sortino']:.2f}<br>"
+            f"Turnover: {result['turnover']:.2f}<br>"
+            f"Time in Market: {result['time_in_market']:.2%}<br>"
+            f"Commission Drag: {result['commission_drag']:.2%}"
         )
 
         # Add annotation near the last point of stock1
@@ -159,8 +165,10 @@ class StockPairVisualizer:
         margin_init = float(self.margin_init_var.get())
         margin_ratio = float(self.margin_ratio_var.get())
 
-        # Fetch data for the selected pair
-        df = self.data_handler.data_1d[[stock1, stock2]]
+        # Use the shared price matrix when available (zero-copy pair views)
+        df = self.data_handler.price_matrix
+        if df is None:
+            df = self.data_handler.data_1d[[stock1, stock2]]
 
         # Run the analysis
         analysis = PairTradingFinancialAnalysis(
@@ -170,7 +178,8 @@ class StockPairVisualizer:
             zscore_threshold=zscore_threshold,
             margin_init=margin_init,
             margin_ratio=margin_ratio,
-            neutral_threshold=neutral_threshold
+            neutral_threshold=neutral_threshold,
+            lag=self.data_handler.pair_lags.get((stock1, stock2), 0)
         )
         result = analysis.run_analysis()
 
@@ -187,12 +196,19 @@ class StockPairVisualizer:
             # Write pair and parameters
             writer.writerow([f"Pair: {stock1} & {stock2}"])
             writer.writerow(["Window", window])
+            writer.writerow(["Lag", result["lag"]])
             writer.writerow(["Z-Score Threshold", zscore_threshold])
             writer.writerow(["Neutral Threshold", neutral_threshold])
             writer.writerow(["Initial Margin", margin_init])
             writer.writerow(["Margin Ratio", margin_ratio])
             writer.writerow(["Final Margin", result["final_margin"]])
             writer.writerow(["Total PnL", result["total_pnl"]])
+            writer.writerow(["Max Drawdown", result["max_drawdown"]])
+            writer.writerow(["Sharpe", result["sharpe"]])
+            writer.writerow(["Sortino", result["sortino"]])
+            writer.writerow(["Turnover", result["turnover"]])
+            writer.writerow(["Time in Market", result["time_in_market"]])
+            writer.writerow(["Commission Drag", result["commission_drag"]])
             writer.writerow([])  # Blank line
 
             # Write trading signals